@@ -0,0 +1,60 @@
+"""Ahead-of-time build of the Numba kernels in power_index_calculator.
+
+Running
+
+    python kernels.py
+
+writes a banzhaf_kernels extension module next to this file. When it can be
+imported, power_index_calculator uses it for small games and for the
+enumeration references, so those skip the JIT warm-up. Large games still use
+the parallel JIT kernels, as AOT builds are single-threaded.
+
+The build is stamped with a hash of the kernel source. After the kernels
+change, power_index_calculator warns and falls back to JIT until this is
+rerun.
+
+numba.pycc is deprecated: Numba 0.68 emits NumbaPendingDeprecationWarning
+on import, and a future release may remove it.
+"""
+
+import os
+
+from numba.pycc import CC
+
+import power_index_calculator as pic
+
+
+cc = CC("banzhaf_kernels")
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Lets power_index_calculator detect a build from older kernel source
+SOURCE_HASH = pic._kernel_source_hash()
+
+
+def source_hash():
+    return SOURCE_HASH
+
+
+cc.export("source_hash", "i8()")(source_hash)
+
+# Exported under the kernels' own names, suffixed with the table dtype when it
+# is not int64, so they can be looked up directly
+cc.export("_banzhaf_dp_kernel", "i8[:](i8[:], i8, i8, i8[:])")(
+    pic._banzhaf_dp_kernel.py_func
+)
+cc.export("_banzhaf_dp_kernel_int32", "i4[:](i8[:], i8, i8, i4[:])")(
+    pic._banzhaf_dp_kernel.py_func
+)
+cc.export("_shapley_dp_kernel", "i8[:, :](i8[:], i8, i8, i8[:, :])")(
+    pic._shapley_dp_kernel.py_func
+)
+cc.export("_banzhaf_enum_kernel", "i8[:](i8[:], i8)")(
+    pic._banzhaf_enum_kernel.py_func
+)
+cc.export("_shapley_enum_kernel", "i8[:, :](i8[:], i8)")(
+    pic._shapley_enum_kernel.py_func
+)
+
+
+if __name__ == "__main__":
+    cc.compile()
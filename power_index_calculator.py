@@ -1,6 +1,38 @@
-import powerindex as px
-from itertools import combinations, permutations
+import hashlib
+import inspect
+import warnings
+from functools import lru_cache
 from math import factorial
+from numbers import Integral, Real
+
+import numpy as np
+import powerindex as px
+from numba import get_num_threads, njit, prange, set_num_threads
+
+try:
+    # Numba internal with no stability guarantee; lowers to a single cttz
+    from numba.cpython.unsafe.numbers import trailing_zeros
+except ImportError:
+    @njit(cache=True)
+    def trailing_zeros(x):
+        """Return the index of the lowest set bit of x (x > 0)."""
+        bit = x & -x
+        index = 0
+        while bit > 1:
+            bit >>= 1
+            index += 1
+        return index
+
+try:
+    # ahead-of-time build of the kernels, see kernels.py
+    import banzhaf_kernels
+except ImportError:
+    banzhaf_kernels = None
+
+try:
+    import cupy
+except ImportError:
+    cupy = None
 
 """This information is taken DIRECTLY from the official IPU Parline Database and is available at:
 https://data.ipu.org/election-summary/HTML/2251_90.htm
@@ -25,109 +57,512 @@ As well as a custom Banzhaf calculation script.
 """
 
 
-def banzhaf_powerindex(weights, quota):
-    """Return normalized Banzhaf indices using the powerindex library."""
-    game = px.Game(quota=quota, weights=weights)
+def banzhaf_powerindex(weights, quota, game=None):
+    """
+    Return normalized Banzhaf indices using the powerindex library.
+    Pass a prebuilt px.Game for (weights, quota) to reuse it.
+    """
+    if game is None:
+        game = px.Game(quota=quota, weights=weights)
     game.calc_banzhaf()
 
     return game.banzhaf
 
 
-def banzhaf_custom(weights, quota):
+# Every DP cell counts subsets of the players, so it is at most 2**n: int32
+# tables are exact up to 30 players and int64 tables up to 62; larger games
+# use Python ints instead. The enumeration references step an int64 Gray-code
+# counter up to 1 << n, so they stop at the same size.
+MAX_INT32_PLAYERS = 30
+MAX_INT64_PLAYERS = 62
+
+
+def _as_int(value, name):
+    """Return an integral number as an int; raise ValueError otherwise."""
+    if isinstance(value, Integral):
+        return int(value)
+    if isinstance(value, Real) and float(value).is_integer():
+        return int(value)
+    raise ValueError(f"{name} must be an integer, got {value!r}")
+
+
+def _integer_game(weights, quota):
     """
-    Compute Banzhaf indices by exhaustive enumeration.
+    Return weights and quota as ints. The DP indexes its tables by weight and
+    the enumeration kernels add weights in int64, so non-integral values
+    raise ValueError rather than being truncated.
+    """
+    return [_as_int(w, "each weight") for w in weights], _as_int(quota, "quota")
 
-    A player is critical in a coalition if:
-      - the coalition (including them) meets the quota,
-      - but without them, it fails the quota.
+
+def _count_dtype(n, narrow=False):
+    """
+    Return the dtype for DP count tables over n players. narrow allows int32
+    for small games, halving the memory traffic of the table.
+    """
+    if narrow and n <= MAX_INT32_PLAYERS:
+        return np.int32
+    return np.int64 if n <= MAX_INT64_PLAYERS else object
+
+
+# Below this many distinct weights the removals run on one thread; starting
+# threads costs more than the O(n * Q) work per weight.
+PARALLEL_MIN_GROUPS = 16
+
+
+def _kernel_source_hash():
+    """Return a 63-bit hash of the kernels' source, stamped into AOT builds."""
+    source = "".join(
+        inspect.getsource(kernel.py_func)
+        for kernel in (
+            _banzhaf_dp_kernel, _shapley_dp_kernel,
+            _banzhaf_enum_kernel, _shapley_enum_kernel,
+        )
+    )
+    digest = hashlib.sha256(source.encode()).digest()
+    return int.from_bytes(digest[:8], "little") >> 1
+
+
+@lru_cache(maxsize=None)
+def _aot_kernels():
+    """Return banzhaf_kernels if it was built from the current kernels, else None."""
+    if banzhaf_kernels is None:
+        return None
+    source_hash = getattr(banzhaf_kernels, "source_hash", None)
+    if source_hash is None or source_hash() != _kernel_source_hash():
+        warnings.warn(
+            "banzhaf_kernels was built from other kernel source; using the JIT "
+            "kernels instead. Rerun `python kernels.py` to rebuild it."
+        )
+        return None
+    return banzhaf_kernels
+
+
+def _aot_or_jit(kernel, dtype=np.int64):
+    """
+    Return the ahead-of-time build of a kernel for tables of the given dtype
+    if there is an up-to-date one, else the kernel.
     """
-    num_parties = len(weights)
-    critical_counts = [0] * num_parties
+    name = kernel.__name__
+    if dtype != np.int64:
+        name = f"{name}_{np.dtype(dtype).name}"
+    return getattr(_aot_kernels(), name, kernel)
+
+
+def _run_kernel(kernel, weights, total_weight, quota, full):
+    """
+    Run a removal kernel over the distinct weights. Integer tables use the
+    jitted kernel, parallel over Numba threads (or its ahead-of-time build
+    for small games); object tables use its pure-Python body.
+    """
+    if full.dtype == object:
+        # Python ints have no Numba type. Worker processes cost more to start
+        # than these removals take, so this stays serial.
+        return kernel.py_func(weights, total_weight, quota, full)
+
+    if weights.size >= PARALLEL_MIN_GROUPS:
+        return kernel(weights, total_weight, quota, full)
 
-    # Generate all possible coalitions
-    for coalition_size in range(1, num_parties + 1):
-        for coalition in combinations(range(num_parties), coalition_size):
-            coalition_weight = sum(weights[i] for i in coalition)
+    serial_kernel = _aot_or_jit(kernel, full.dtype)
+    if serial_kernel is not kernel:
+        # AOT builds are single-threaded and never start Numba's thread pool
+        return serial_kernel(weights, total_weight, quota, full)
 
-            if coalition_weight < quota:
-                continue
+    num_threads = get_num_threads()
+    set_num_threads(1)
+    try:
+        return kernel(weights, total_weight, quota, full)
+    finally:
+        set_num_threads(num_threads)
 
-            for i in coalition:
-                if coalition_weight - weights[i] < quota:
-                    critical_counts[i] += 1
 
+@njit(cache=True, parallel=True)
+def _banzhaf_dp_kernel(weights, total_weight, quota, full):
+    """
+    Return the swing count of a player of each distinct weight, given the
+    full weight-count polynomial.
+    """
+    d = weights.size
+    swings = np.zeros(d, dtype=full.dtype)
+
+    for g in prange(d):
+        w = weights[g]
+        # The others weigh at most total_weight - w; without is zero above that
+        hi = min(full.size, total_weight - w + 1)
+        # Reverse of the forward update: without[t] = full[t] - without[t - w]
+        without = full.copy()
+        for t in range(w, hi):
+            without[t] -= without[t - w]
+        swings[g] = without[max(0, quota - w):hi].sum()
+
+    return swings
+
+
+# With use_gpu, at or above this many distinct weights the Banzhaf removals
+# run on the GPU when CuPy can see one.
+GPU_MIN_GROUPS = 20
+
+# One block per distinct weight. The reverse recurrence only links t to
+# t - w, so the chains starting at w..2w-1 are independent and each thread
+# walks its own chains.
+_REMOVE_WEIGHT_SRC = r"""
+extern "C" __global__
+void remove_weight(const long long* full, const long long* weights,
+                   long long* out, long long size, long long total_weight)
+{
+    long long w = weights[blockIdx.x];
+    long long* without = out + blockIdx.x * size;
+    long long hi = min(size, total_weight - w + 1);
+
+    for (long long t = threadIdx.x; t < size; t += blockDim.x)
+        without[t] = full[t];
+    __syncthreads();
+
+    if (w == 0)
+        return;
+    for (long long start = w + threadIdx.x; start < min(2 * w, hi); start += blockDim.x)
+        for (long long t = start; t < hi; t += w)
+            without[t] -= without[t - w];
+}
+"""
+
+_remove_weight_gpu = (
+    cupy.RawKernel(_REMOVE_WEIGHT_SRC, "remove_weight") if cupy is not None else None
+)
+
+
+def _use_gpu(weights, full, use_gpu):
+    """Return whether the Banzhaf removals for these distinct weights go to the GPU."""
+    return (
+        use_gpu
+        and cupy is not None
+        and full.dtype != object
+        and weights.size >= GPU_MIN_GROUPS
+        and cupy.cuda.is_available()
+    )
+
+
+def _banzhaf_dp_gpu(weights, total_weight, quota, full):
+    """GPU version of _banzhaf_dp_kernel."""
+    d = weights.size
+    size = full.size
+    full_gpu = cupy.asarray(full, dtype=cupy.int64)
+    weights_gpu = cupy.asarray(weights)
+    without = cupy.empty((d, size), dtype=cupy.int64)
+    _remove_weight_gpu(
+        (d,), (128,),
+        (full_gpu, weights_gpu, without, np.int64(size), np.int64(total_weight)),
+    )
+
+    # sum each row over its swing window [quota - w, hi) on the device
+    t = cupy.arange(size)
+    lo = cupy.maximum(0, quota - weights_gpu)[:, None]
+    hi = cupy.minimum(size, total_weight - weights_gpu + 1)[:, None]
+    swings = cupy.where((t >= lo) & (t < hi), without, 0).sum(axis=1)
+    return swings.get()
+
+
+def _weight_counts(weights, quota, dtype, by_size=False):
+    """
+    Return full[t]: coalitions of all players weighing t, for t < quota (the
+    coefficients of prod_i (1 + x^w_i)). With by_size, full[s, t] also splits
+    them by size s.
+    """
+    n = len(weights)
+    if by_size:
+        full = np.zeros((n + 1, quota), dtype=dtype)
+        full[0, 0] = 1
+    else:
+        full = np.zeros(quota, dtype=dtype)
+        full[0] = 1
+
+    running = 0
+    for j, w in enumerate(weights):
+        running += w
+        # after j + 1 players coalitions have at most j + 1 members and weigh
+        # at most running
+        hi = min(quota, running + 1)
+        if w >= hi:
+            continue
+        if by_size:
+            full[1:j + 2, w:hi] += full[:j + 1, :hi - w]
+        else:
+            full[w:hi] += full[:hi - w]
+
+    return full
+
+
+def _weight_groups(weights):
+    """
+    Return the distinct weights and each player's index into them. Players of
+    equal weight swing the same coalitions, so each distinct weight is
+    divided out once and the result shared.
+    """
+    return np.unique(np.asarray(weights, dtype=np.int64), return_inverse=True)
+
+
+def _normalize(critical_counts):
+    """Return Banzhaf indices: each player's share of all swings."""
     total_critical = sum(critical_counts)
+    return [c / total_critical if total_critical else 0.0 for c in critical_counts]
 
-    banzhaf_values = [
-        c / total_critical if total_critical else 0.0 for c in critical_counts
-    ]
-    return critical_counts, banzhaf_values
 
+def banzhaf_custom(weights, quota, use_gpu=False):
+    """
+    Compute Banzhaf indices by subset-sum dynamic programming.
+
+    A player is critical in a coalition if:
+      - the coalition (including them) meets the quota,
+      - but without them, it fails the quota.
+
+    So player i is critical exactly for the coalitions of the other players
+    weighing between quota - w_i and quota - 1. full[t] counts coalitions of
+    all players with weight t (the coefficients of prod_i (1 + x^w_i)), and
+    dividing out player i's factor leaves the counts without them.
+
+    Only weights below the quota are ever read, so full is a single row
+    truncated at quota - 1; compute_indices carries the extra size axis that
+    Shapley-Shubik needs.
+
+    With use_gpu=True, large games run the removals on a CUDA device through
+    CuPy when one is available.
+    """
+    weights, quota = _integer_game(weights, quota)
+    if quota <= 0:
+        # every coalition wins, even the empty one, so nobody is critical
+        return [0] * len(weights), [0.0] * len(weights)
+
+    full = _weight_counts(weights, quota, _count_dtype(len(weights), narrow=True))
+    distinct, player_group = _weight_groups(weights)
+    if _use_gpu(distinct, full, use_gpu):
+        swings = _banzhaf_dp_gpu(distinct, sum(weights), quota, full)
+    else:
+        swings = _run_kernel(_banzhaf_dp_kernel, distinct, sum(weights), quota, full)
+    critical_counts = swings[player_group].tolist()
+    return critical_counts, _normalize(critical_counts)
+
+
+@njit(cache=True)
+def _banzhaf_enum_kernel(weights, quota):
+    """Return each player's swing count by walking all coalitions in Gray-code order."""
+    n = weights.size
+    critical_counts = np.zeros(n, dtype=np.int64)
+    member = np.zeros(n, dtype=np.int64)  # 0/1 membership of the current coalition
+    coalition_weight = 0
+
+    for g in range(1, 1 << n):
+        # Consecutive Gray codes differ in exactly one bit: the lowest set bit of g
+        flipped = trailing_zeros(g)
+        member[flipped] ^= 1
+        if member[flipped]:
+            coalition_weight += weights[flipped]
+        else:
+            coalition_weight -= weights[flipped]
+
+        # Winning coalitions have slack >= 0; member i is critical iff
+        # coalition_weight - weights[i] < quota, i.e. slack < weights[i]
+        slack = coalition_weight - quota
+        if slack < 0:
+            continue
+
+        # branchless over all players so the loop vectorizes
+        for i in range(n):
+            critical_counts[i] += member[i] & (slack < weights[i])
+
+    return critical_counts
+
+
+def _run_enum_kernel(kernel, weights, quota):
+    """Run an enumeration kernel, checking the game fits its int64 Gray-code counter."""
+    if len(weights) > MAX_INT64_PLAYERS:
+        raise ValueError(
+            f"Enumeration supports at most {MAX_INT64_PLAYERS} players"
+        )
+
+    return _aot_or_jit(kernel)(np.asarray(weights, dtype=np.int64), quota)
+
+
+def banzhaf_enumerate(weights, quota):
+    """
+    Compute Banzhaf indices by exhaustive enumeration. Exponential in the
+    number of players; kept to verify banzhaf_custom.
+
+    A player is critical in a coalition if:
+      - the coalition (including them) meets the quota,
+      - but without them, it fails the quota.
+    """
+    weights, quota = _integer_game(weights, quota)
+    critical_counts = _run_enum_kernel(_banzhaf_enum_kernel, weights, quota).tolist()
+    return critical_counts, _normalize(critical_counts)
 
-def shapley_powerindex(weights, quota):
-    """Return Shapley-Shubik indices using the powerindex library."""
-    game = px.Game(quota=quota, weights=weights)
+
+def shapley_powerindex(weights, quota, game=None):
+    """
+    Return Shapley-Shubik indices using the powerindex library.
+    Pass a prebuilt px.Game for (weights, quota) to reuse it.
+    """
+    if game is None:
+        game = px.Game(quota=quota, weights=weights)
     game.calc_shapley_shubik()
 
     return game.shapley_shubik
 
 
-def shapley_custom(weights, quota):
-    """Compute Shapley-Shubik indices by enumerating player orderings."""
-    num_parties = len(weights)
-    pivotal_counts = [0] * num_parties
+@njit(cache=True)
+def _shapley_enum_kernel(weights, quota):
+    """
+    Return counts[i, s]: coalitions of size s without player i for which
+    player i is pivotal, by walking all coalitions in Gray-code order.
+    """
+    n = weights.size
+    # Indexed [s, i] so each coalition updates one contiguous row. The extra
+    # row n is for the grand coalition, visited when it still loses
+    # (quota > sum(weights)); it has no non-members and is dropped at the end.
+    counts_by_size = np.zeros((n + 1, n), dtype=np.int64)
+    outside = np.ones(n, dtype=np.int64)  # 0/1 non-membership of the current coalition
+    size = 0
+    coalition_weight = 0
+
+    for g in range(1 << n):
+        if g:
+            # Consecutive Gray codes differ in exactly one bit: the lowest set bit of g
+            flipped = trailing_zeros(g)
+            outside[flipped] ^= 1
+            if outside[flipped]:
+                coalition_weight -= weights[flipped]
+                size -= 1
+            else:
+                coalition_weight += weights[flipped]
+                size += 1
+
+        # Losing coalitions have shortfall > 0; non-member i is pivotal iff
+        # coalition_weight + weights[i] >= quota, i.e. weights[i] >= shortfall
+        shortfall = quota - coalition_weight
+        if shortfall <= 0:
+            continue
+
+        # branchless over all players so the loop vectorizes
+        row = counts_by_size[size]
+        for i in range(n):
+            row[i] += outside[i] & (weights[i] >= shortfall)
+
+    return np.ascontiguousarray(counts_by_size[:n].T)
+
+
+def shapley_custom(weights, quota, use_dp=True):
+    """
+    Compute Shapley-Shubik indices.
+
+    By default this delegates to shapley_dp. With use_dp=False it enumerates
+    every coalition instead, which is O(n * 2^n) and only meant as a
+    reference for small games.
+    """
+    weights, quota = _integer_game(weights, quota)
+    if use_dp:
+        return shapley_dp(weights, quota)
 
-    for ordering in permutations(range(num_parties)):
-        cumulative = 0
-        for player in ordering:
-            cumulative += weights[player]
-            if cumulative >= quota:
-                pivotal_counts[player] += 1
-                break
+    counts = _run_enum_kernel(_shapley_enum_kernel, weights, quota)
+    pivotal_counts = _pivotal_orderings(counts)
 
-    total_permutations = factorial(num_parties)
+    total_permutations = factorial(len(weights))
     shapley_values = [
         count / total_permutations if total_permutations else 0.0
         for count in pivotal_counts
     ]
     return pivotal_counts, shapley_values
 
+@njit(cache=True, parallel=True)
+def _shapley_dp_kernel(weights, total_weight, quota, full):
+    """
+    Return counts[g, s]: coalitions of size s without one player of weight
+    weights[g] for which that player is pivotal, i.e. weighing between
+    quota - weights[g] and quota - 1.
+    """
+    n = full.shape[0] - 1
+    d = weights.size
+    counts = np.zeros((d, n), dtype=full.dtype)
+
+    for g in prange(d):
+        w = weights[g]
+        # The others weigh at most total_weight - w; without is zero above that
+        hi = min(quota, total_weight - w + 1)
+        # Reverse of the forward update: without[s, t] = full[s, t] - without[s-1, t-w]
+        without = full.copy()
+        for s in range(1, n):
+            for t in range(w, hi):
+                without[s, t] -= without[s - 1, t - w]
+
+        for s in range(n):  # size of coalition before i
+            for t in range(max(0, quota - w), hi):
+                counts[g, s] += without[s, t]
+
+    return counts
+
+
+def _swing_counts_by_size(weights, quota):
+    """
+    Return counts[i, s]: coalitions of size s without player i that player i
+    turns from losing into winning.
+    """
+    n = len(weights)
+    dtype = _count_dtype(n)
+    if quota <= 0:
+        # every coalition wins, even the empty one, so nobody swings one
+        return np.zeros((n, n), dtype=dtype)
+
+    full = _weight_counts(weights, quota, dtype, by_size=True)
+    distinct, player_group = _weight_groups(weights)
+    counts = _run_kernel(_shapley_dp_kernel, distinct, sum(weights), quota, full)
+    return counts[player_group]
+
+
+def _pivotal_orderings(counts):
+    """Weight each swing coalition by the orderings in which it precedes i."""
+    n = counts.shape[0]
+    fact = [1] * (n + 1)
+    for k in range(1, n + 1):
+        fact[k] = fact[k - 1] * k
+
+    # coeff[s] = s! * (n-s-1)!, kept as Python ints (object dtype) since the
+    # products overflow int64 beyond n = 20
+    coeff = np.array([fact[s] * fact[n-s-1] for s in range(n)], dtype=object)
+    return np.dot(counts.astype(object), coeff).tolist()
+
+
 def shapley_dp(weights, quota):
     """
     Compute Shapley-Shubik indices using dynamic programming / coalition counting.
     Returns pivotal_counts, shapley_values (same as shapley_custom).
     """
-    n = len(weights)
-    total_permutations = factorial(n)
-    pivotal_counts = [0] * n
-
-    # For each player, count pivotal permutations via DP
-    for i, w in enumerate(weights):
-        # DP table: dp[s][t] = number of coalitions of size s (without i) summing to t
-        dp = [[0] * (quota) for _ in range(n)]  # up to quota-1 is enough
-        dp[0][0] = 1
-
-        # build subsets from other players
-        for j, wj in enumerate(weights):
-            if j == i:
-                continue
-            # update in reverse to avoid reuse
-            for s in range(n-2, -1, -1):
-                for t in range(quota-1-wj, -1, -1):
-                    dp[s+1][t+wj] += dp[s][t]
-
-        # now count pivot contributions
-        for s in range(n):  # size of coalition before i
-            for t in range(quota):  # weight of coalition
-                if quota - w <= t <= quota-1:
-                    count = dp[s][t]
-                    if count:
-                        pivotal_counts[i] += count * factorial(s) * factorial(n-s-1)
+    weights, quota = _integer_game(weights, quota)
+    total_permutations = factorial(len(weights))
+    pivotal_counts = _pivotal_orderings(_swing_counts_by_size(weights, quota))
 
     shapley_values = [count / total_permutations for count in pivotal_counts]
     return pivotal_counts, shapley_values
 
 
+def compute_indices(weights, quota):
+    """
+    Compute Banzhaf and Shapley-Shubik indices from a single DP pass.
+
+    Both count the coalitions of the other players that each player swings:
+    Banzhaf ignores their size, Shapley-Shubik weights them by it.
+    Returns (critical_counts, banzhaf_values), (pivotal_counts, shapley_values).
+    """
+    weights, quota = _integer_game(weights, quota)
+    counts = _swing_counts_by_size(weights, quota)
+
+    critical_counts = counts.sum(axis=1).tolist()
+    banzhaf_values = _normalize(critical_counts)
+
+    total_permutations = factorial(len(weights))
+    pivotal_counts = _pivotal_orderings(counts)
+    shapley_values = [count / total_permutations for count in pivotal_counts]
+
+    return (critical_counts, banzhaf_values), (pivotal_counts, shapley_values)
+
+
 def main():
     #seats = [62, 53, 32, 16, 4, 7, 3, 3]
     seats = [52,29,9,9,6,4,3,3,3,2]
@@ -140,32 +575,39 @@ def main():
     print(f"Quota: {quota}")
     print(f"Seats: {seats}\n")
 
-    # Power index
-    banzhaf_px = banzhaf_powerindex(seats, quota)
+    # Power index, one game shared by both indices
+    game = px.Game(quota=quota, weights=seats)
+    banzhaf_px = banzhaf_powerindex(seats, quota, game=game)
     print("=== Banzhaf via powerindex ===")
     if banzhaf_px is not None:
         values = [round(x * 100, 2) for x in banzhaf_px]
         print(values)
 
-    # Custom implementation
-    critical_counts, banzhaf_values = banzhaf_custom(seats, quota)
+    # Custom implementation, both indices from one DP
+    (critical_counts, banzhaf_values), (shapley_counts, shapley_values) = (
+        compute_indices(seats, quota)
+    )
     values_custom = [round(x * 100, 2) for x in banzhaf_values]
     print("\n=== Banzhaf via custom implementation ===")
     print(values_custom)
     print("\nCritical Counts:", critical_counts)
 
-    shapley_px = shapley_powerindex(seats, quota)
+    _, banzhaf_values_enum = banzhaf_enumerate(seats, quota)
+    values_enum = [round(x * 100, 2) for x in banzhaf_values_enum]
+    print("\n=== Banzhaf via enumeration ===")
+    print(values_enum)
+
+    shapley_px = shapley_powerindex(seats, quota, game=game)
     print("\n=== Shapley-Shubik via powerindex ===")
     if shapley_px is not None:
         shapley_values_px = [round(x, 3) for x in shapley_px]
         print(shapley_values_px)
 
-    shapley_counts, shapley_values = shapley_custom(seats, quota)
-    shapley_values_custom = [round(x, 3) for x in shapley_values]
+    _, shapley_values_perm = shapley_custom(seats, quota, use_dp=False)
+    shapley_values_custom = [round(x, 3) for x in shapley_values_perm]
     print("\n=== Shapley-Shubik via custom implementation ===")
     print(shapley_values_custom)
-    
-    shapley_counts, shapley_values = shapley_dp(seats, quota)
+
     shapley_values_dp = [round(x, 3) for x in shapley_values]
     print("\n=== Shapley-Shubik via dp implementation ===")
     print(shapley_values_dp)
@@ -0,0 +1,326 @@
+import os
+import shutil
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import power_index_calculator as pic
+
+PERU_1990 = [62, 53, 32, 16, 4, 7, 3, 3]
+PERU_SEATS = [52, 29, 9, 9, 6, 4, 3, 3, 3, 2]
+
+SMALL_GAMES = [
+    ([0, 3, 0, 2], 3),      # zero weights
+    ([0, 0, 0], 1),         # nobody can win
+    ([5, 1, 2], 4),         # a weight above the quota
+    ([4, 1, 1], 4),         # a weight exactly at the quota
+    ([1, 2, 3], 10),        # quota above sum(weights)
+    ([3, 3, 2, 2, 1], 6),   # repeated weights
+]
+
+
+def majority(weights):
+    return sum(weights) // 2 + 1
+
+
+@pytest.mark.parametrize("weights", [PERU_1990, PERU_SEATS])
+def test_banzhaf_matches_powerindex(weights):
+    quota = majority(weights)
+    critical_counts, banzhaf_values = pic.banzhaf_custom(weights, quota)
+    assert (critical_counts, banzhaf_values) == pic.banzhaf_enumerate(weights, quota)
+    assert banzhaf_values == pytest.approx(pic.banzhaf_powerindex(weights, quota))
+
+
+@pytest.mark.parametrize("weights", [PERU_1990, PERU_SEATS])
+def test_shapley_matches_powerindex(weights):
+    quota = majority(weights)
+    assert pic.shapley_dp(weights, quota)[1] == pytest.approx(
+        pic.shapley_powerindex(weights, quota)
+    )
+
+
+@pytest.mark.parametrize("weights, quota", SMALL_GAMES)
+def test_banzhaf_matches_enumeration(weights, quota):
+    assert pic.banzhaf_custom(weights, quota) == pic.banzhaf_enumerate(weights, quota)
+
+
+@pytest.mark.parametrize(
+    "weights, quota",
+    [(PERU_1990, majority(PERU_1990)), (PERU_SEATS, majority(PERU_SEATS))]
+    + SMALL_GAMES,
+)
+def test_compute_indices_matches_separate_calculations(weights, quota):
+    banzhaf, shapley = pic.compute_indices(weights, quota)
+    assert banzhaf == pic.banzhaf_custom(weights, quota)
+    assert shapley == pic.shapley_custom(weights, quota, use_dp=False)
+
+
+def test_object_tables_match_int64_tables(monkeypatch):
+    # 65 players need object tables, but with few distinct weights every
+    # count still fits in int64, so the same game can run on both
+    weights = [1, 2, 3, 4, 5] * 13
+    quota = majority(weights)
+    assert pic._count_dtype(len(weights)) is object
+    banzhaf, shapley = pic.compute_indices(weights, quota)
+
+    monkeypatch.setattr(pic, "MAX_INT64_PLAYERS", len(weights))
+    assert pic._count_dtype(len(weights)) is np.int64
+    assert pic.compute_indices(weights, quota) == (banzhaf, shapley)
+    assert pic.banzhaf_custom(weights, quota) == banzhaf
+
+
+ENTRY_POINTS = [
+    pic.banzhaf_custom,
+    pic.banzhaf_enumerate,
+    pic.shapley_dp,
+    pic.compute_indices,
+    lambda weights, quota: pic.shapley_custom(weights, quota, use_dp=False),
+]
+
+
+@pytest.mark.parametrize("calculate", ENTRY_POINTS)
+@pytest.mark.parametrize("weights, quota", [([1.5, 0.6], 2), ([1, 2], 2.5)])
+def test_non_integral_games_are_rejected(calculate, weights, quota):
+    with pytest.raises(ValueError, match="must be an integer"):
+        calculate(weights, quota)
+
+
+@pytest.mark.parametrize("calculate", ENTRY_POINTS)
+def test_integral_floats_and_numpy_ints_are_accepted(calculate):
+    expected = calculate([3, 2, 1], 4)
+    assert calculate([3.0, 2.0, 1.0], 4.0) == expected
+    assert calculate(np.array([3, 2, 1]), np.int64(4)) == expected
+
+
+def test_enumeration_rejects_games_past_int64():
+    weights = [1] * (pic.MAX_INT64_PLAYERS + 1)
+    with pytest.raises(ValueError, match="at most"):
+        pic.banzhaf_enumerate(weights, majority(weights))
+    with pytest.raises(ValueError, match="at most"):
+        pic.shapley_custom(weights, majority(weights), use_dp=False)
+
+
+def test_non_positive_quota_has_no_swings():
+    weights = [1, 2]
+    for quota in (0, -3):
+        assert pic.banzhaf_custom(weights, quota) == ([0, 0], [0.0, 0.0])
+        assert pic.banzhaf_enumerate(weights, quota) == ([0, 0], [0.0, 0.0])
+        assert pic.shapley_dp(weights, quota) == ([0, 0], [0.0, 0.0])
+        (critical_counts, _), (pivotal_counts, _) = pic.compute_indices(
+            weights, quota
+        )
+        assert critical_counts == [0, 0]
+        assert pivotal_counts == [0, 0]
+
+
+def test_object_tables_after_parallel_jit_exit_cleanly():
+    # A parallel int64 game starts Numba's worker threads; a game with more
+    # than 62 players then uses object tables. The interpreter used to hang
+    # on exit after that, so run it in its own process with a timeout.
+    script = textwrap.dedent("""
+        import power_index_calculator as pic
+
+        small = list(range(1, 41))
+        pic.banzhaf_custom(small, sum(small) // 2 + 1)
+
+        large = list(range(1, 71))
+        quota = sum(large) // 2 + 1
+        (critical_counts, _), _ = pic.compute_indices(large, quota)
+        assert critical_counts == pic.banzhaf_custom(large, quota)[0]
+    """)
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT, timeout=120,
+        capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_stale_aot_build_falls_back_to_jit(monkeypatch):
+    class StaleBuild:
+        @staticmethod
+        def source_hash():
+            return pic._kernel_source_hash() ^ 1
+
+        _banzhaf_enum_kernel = staticmethod(lambda weights, quota: None)
+
+    monkeypatch.setattr(pic, "banzhaf_kernels", StaleBuild)
+    pic._aot_kernels.cache_clear()
+    try:
+        with pytest.warns(UserWarning, match="kernels.py"):
+            kernel = pic._aot_or_jit(pic._banzhaf_enum_kernel)
+        assert kernel is pic._banzhaf_enum_kernel
+    finally:
+        pic._aot_kernels.cache_clear()
+
+
+def test_object_tables_from_unguarded_script(tmp_path):
+    # Worker processes used to re-import the caller's __main__, so a script
+    # file without an `if __name__ == "__main__"` guard broke; python -c
+    # has no file to re-import and hid that
+    script = tmp_path / "unguarded.py"
+    script.write_text(textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {str(ROOT)!r})
+        import power_index_calculator as pic
+
+        weights = list(range(1, 71))
+        quota = sum(weights) // 2 + 1
+        (critical_counts, _), _ = pic.compute_indices(weights, quota)
+        assert critical_counts == pic.banzhaf_custom(weights, quota)[0]
+    """))
+    result = subprocess.run(
+        [sys.executable, str(script)], timeout=120, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_aot_build_skips_numba_threads(monkeypatch):
+    class CurrentBuild:
+        source_hash = staticmethod(pic._kernel_source_hash)
+        _banzhaf_dp_kernel_int32 = staticmethod(pic._banzhaf_dp_kernel.py_func)
+
+    def no_threads():
+        raise AssertionError("the AOT path started Numba's thread pool")
+
+    expected = pic.banzhaf_custom(PERU_SEATS, majority(PERU_SEATS))
+    monkeypatch.setattr(pic, "banzhaf_kernels", CurrentBuild)
+    monkeypatch.setattr(pic, "get_num_threads", no_threads)
+    pic._aot_kernels.cache_clear()
+    try:
+        assert pic.banzhaf_custom(PERU_SEATS, majority(PERU_SEATS)) == expected
+    finally:
+        pic._aot_kernels.cache_clear()
+
+
+def test_shapley_enumeration_when_grand_coalition_loses(tmp_path):
+    # Bounds checks only apply to fresh compiles, so skip the on-disk cache
+    env = dict(os.environ, NUMBA_BOUNDSCHECK="1", NUMBA_CACHE_DIR=str(tmp_path))
+    script = textwrap.dedent("""
+        import power_index_calculator as pic
+
+        assert pic.shapley_custom([1, 2, 3], 10, use_dp=False) == (
+            pic.shapley_dp([1, 2, 3], 10)
+        )
+    """)
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT, env=env, timeout=120,
+        capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def random_removal_tables(seed, count=20):
+    """Yield (distinct weights, total_weight, quota, full) for _banzhaf_dp_kernel."""
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        quota = int(rng.integers(1, 60))
+        weights = np.unique(rng.integers(0, 2 * quota, size=int(rng.integers(1, 30))))
+        total_weight = int(weights.sum() + rng.integers(0, quota))
+        full = rng.integers(0, 1 << 20, size=quota).astype(np.int64)
+        yield weights.astype(np.int64), total_weight, quota, full
+
+
+def emulate_banzhaf_dp_gpu(weights, total_weight, quota, full, block_dim=4):
+    """
+    Step through remove_weight the way the GPU runs it: each block copies full,
+    then each thread walks the chains starting at w + thread, w + thread +
+    block_dim, ... up to 2w. Threads run last to first, so chains that
+    depended on each other would give a different result.
+    """
+    size = full.size
+    without = np.empty((weights.size, size), dtype=np.int64)
+    for block, w in enumerate(weights):
+        row = without[block]
+        row[:] = full
+        hi = min(size, total_weight - w + 1)
+        if w == 0:
+            continue
+        for thread in reversed(range(block_dim)):
+            for start in range(w + thread, min(2 * w, hi), block_dim):
+                for t in range(start, hi, w):
+                    row[t] -= row[t - w]
+
+    # the same window sums _banzhaf_dp_gpu runs on the device
+    t = np.arange(size)
+    lo = np.maximum(0, quota - weights)[:, None]
+    hi = np.minimum(size, total_weight - weights + 1)[:, None]
+    return np.where((t >= lo) & (t < hi), without, 0).sum(axis=1)
+
+
+def test_gpu_chain_split_matches_kernel():
+    for weights, total_weight, quota, full in random_removal_tables(0):
+        expected = pic._banzhaf_dp_kernel(weights, total_weight, quota, full)
+        assert emulate_banzhaf_dp_gpu(weights, total_weight, quota, full).tolist() == (
+            expected.tolist()
+        )
+
+
+@pytest.mark.skipif(
+    pic.cupy is None or not pic.cupy.cuda.is_available(), reason="needs a CUDA device"
+)
+def test_gpu_removals_match_kernel():
+    for weights, total_weight, quota, full in random_removal_tables(1):
+        expected = pic._banzhaf_dp_kernel(weights, total_weight, quota, full)
+        assert pic._banzhaf_dp_gpu(weights, total_weight, quota, full).tolist() == (
+            expected.tolist()
+        )
+
+    weights = list(range(1, 41))
+    quota = majority(weights)
+    assert pic.banzhaf_custom(weights, quota, use_gpu=True) == (
+        pic.banzhaf_custom(weights, quota)
+    )
+
+
+@pytest.mark.parametrize("n, dtype", [(30, np.int32), (31, np.int64)])
+def test_count_tables_at_int32_limit(n, dtype):
+    # with n zero-weight players every coalition weighs 0: full[0] == 2**n,
+    # the largest cell any n-player table can hold
+    weights = [0] * n
+    full = pic._weight_counts(weights, 1, pic._count_dtype(n, narrow=True))
+    assert full.dtype == dtype
+    assert full[0] == 2 ** n
+    assert pic.banzhaf_custom(weights, 1) == pic.banzhaf_enumerate(weights, 1)
+
+    # the last player swings every coalition of the others
+    critical_counts, _ = pic.banzhaf_custom([0] * (n - 1) + [1], 1)
+    assert critical_counts == [0] * (n - 1) + [2 ** (n - 1)]
+
+
+@pytest.mark.skipif(
+    shutil.which("cc") is None and shutil.which("gcc") is None,
+    reason="needs a C compiler",
+)
+def test_aot_int32_kernel_at_limit(tmp_path):
+    for name in ("kernels.py", "power_index_calculator.py"):
+        shutil.copy(ROOT / name, tmp_path)
+    build = subprocess.run(
+        [sys.executable, "kernels.py"], cwd=tmp_path, timeout=300,
+        capture_output=True, text=True,
+    )
+    assert build.returncode == 0, build.stderr
+
+    script = textwrap.dedent("""
+        import numpy as np
+        import power_index_calculator as pic
+
+        kernel = pic._aot_or_jit(pic._banzhaf_dp_kernel, np.int32)
+        assert kernel is pic.banzhaf_kernels._banzhaf_dp_kernel_int32
+
+        weights = [0] * 30
+        assert pic.banzhaf_custom(weights, 1) == pic.banzhaf_enumerate(weights, 1)
+        critical_counts, _ = pic.banzhaf_custom([0] * 29 + [1], 1)
+        assert critical_counts == [0] * 29 + [2 ** 29]
+    """)
+    result = subprocess.run(
+        [sys.executable, "-W", "error::UserWarning", "-c", script],
+        cwd=tmp_path, timeout=300, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr